@@ -0,0 +1,165 @@
+import json, os, threading
+from concurrent.futures import ThreadPoolExecutor
+from amino import community
+from amino.lib.util import exceptions, parsing, scheduler
+
+SENT = "sent"
+BLOCKED = "chat-requests-blocked"
+NO_THREAD = "no-thread"
+ERROR = "error"
+SKIPPED = "skipped"
+
+class BroadcastResult():
+    def __init__(self, target, status, response = None, error = None):
+        """
+        Build the result of sending a broadcast message to one target.
+        target: the Peer or ChatThread the message was meant for
+        status: one of SENT, BLOCKED, NO_THREAD, ERROR or SKIPPED (already sent according to the checkpoint)
+        response: the response to the send request, if one was made
+        error: the exception that was raised, if status is ERROR
+        """
+        self.target = target
+        self.status = status
+        self.response = response
+        self.error = error
+
+    def __repr__(self):
+        return f"{self.target}: {self.status}"
+
+def target_key(target):
+    """
+    Get the key a target is recorded under in a checkpoint
+    """
+    if isinstance(target, community.ChatThread):
+        return f"thread:{target.uid}"
+
+    return f"peer:{target.uid}"
+
+class Checkpoint():
+    def __init__(self, path, flush_every = 50):
+        """
+        Build a checkpoint that records which broadcast targets are finished.
+        path: location of the json file holding the checkpoint. It's read if it exists
+        flush_every: number of finished targets between writes to the disk
+        """
+        self.path = path
+        self.flush_every = flush_every
+        self._lock = threading.Lock()
+        self._pending = 0
+
+        try:
+            with open(path, "r") as stream:
+                self.done = set(json.load(stream))
+
+        except (FileNotFoundError, json.decoder.JSONDecodeError):
+            self.done = set()
+
+    def __contains__(self, key):
+        return key in self.done
+
+    def mark(self, key):
+        with self._lock:
+            self.done.add(key)
+            self._pending += 1
+
+            if self._pending >= self.flush_every:
+                self._flush()
+
+    def flush(self):
+        with self._lock:
+            self._flush()
+
+    def _flush(self):
+        # write next to the real file first, so an interrupted write can't lose the whole checkpoint
+        with open(f"{self.path}.tmp", "w") as stream:
+            json.dump(sorted(self.done), stream)
+
+        os.replace(f"{self.path}.tmp", self.path)
+        self._pending = 0
+
+def _response_status(response):
+    if response.status_code == 200:
+        return SENT
+
+    try:
+        code = parsing.loads(response.content).get("api:statuscode")
+
+    except ValueError:
+        code = None
+
+    return BLOCKED if code == 1611 else ERROR
+
+def _send(target, thread, message, allow_new, lookup = False):
+    try:
+        if isinstance(target, community.ChatThread):
+            thread = target
+
+        elif thread is None and lookup:
+            # the bulk lookup didn't get through the whole thread list, ask for this peer's thread directly
+            thread = target.get_pm_thread()
+
+        if thread is not None:
+            response = thread.send_text_message(message)
+            return BroadcastResult(target, _response_status(response), response = response)
+
+        if not allow_new:
+            return BroadcastResult(target, NO_THREAD)
+
+        response = target.request_chat(message = message)
+        return BroadcastResult(target, _response_status(response), response = response)
+
+    except exceptions.ChatRequestsBlocked as error:
+        return BroadcastResult(target, BLOCKED, error = error)
+
+    except Exception as error:
+        return BroadcastResult(target, ERROR, error = error)
+
+def broadcast(client, targets, message, workers = None, allow_new = False, checkpoint = None):
+    """
+    Send a text message to many Peers and ChatThreads concurrently. See SubClient.broadcast
+    returns a list of BroadcastResults, in the same order as targets
+    """
+    targets = list(targets)
+    checkpoint = Checkpoint(checkpoint) if isinstance(checkpoint, str) else checkpoint
+    results = [None] * len(targets)
+    pending = []
+
+    for index, target in enumerate(targets):
+        if checkpoint is not None and target_key(target) in checkpoint:
+            results[index] = BroadcastResult(target, SKIPPED)
+
+        else:
+            pending.append(index)
+
+    peers = [targets[index] for index in pending if not isinstance(targets[index], community.ChatThread)]
+
+    with scheduler.priority(scheduler.BACKGROUND):
+        threads, complete = client.resolve_pm_threads(peers) if peers else ({}, True)
+
+    def run(index):
+        target = targets[index]
+
+        # bulk sends shouldn't hold up interactive replies made at the same time
+        with scheduler.priority(scheduler.BACKGROUND):
+            result = _send(target, threads.get(target.uid), message, allow_new, lookup = not complete)
+
+        # errors are left out of the checkpoint so that resuming retries them
+        if checkpoint is not None and result.status != ERROR:
+            checkpoint.mark(target_key(target))
+
+        return result
+
+    # sends run as BACKGROUND requests, so threads beyond the scheduler's cap for the class would only wait on it
+    cap = client.session.scheduler.caps[scheduler.BACKGROUND]
+    workers = min(workers, cap) if workers is not None else cap
+
+    try:
+        with ThreadPoolExecutor(max_workers = workers) as executor:
+            for index, result in zip(pending, executor.map(run, pending)):
+                results[index] = result
+
+    finally:
+        if checkpoint is not None:
+            checkpoint.flush()
+
+    return results
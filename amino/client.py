@@ -1,15 +1,17 @@
-import requests, json, os
+import requests, json, os, threading, weakref
+from concurrent.futures import ThreadPoolExecutor
 from locale import getdefaultlocale as locale
 from time import time, timezone
-from amino import community, media, socket
-from amino.lib.util import exceptions, helpers
+from amino import broadcast, community, directory, events, media, socket
+from amino.lib.util import dedup, exceptions, helpers, parsing, scheduler
 
 class Client():
-    def __init__(self, path = "device.json", callback = socket.Callbacks, socket_trace = False):
+    def __init__(self, path = "device.json", callback = socket.Callbacks, socket_trace = False, max_workers = 8):
         """
         Build the client.
         path: optional location where the generated device info will be stored
         path is relative to where Client is called from (ie the file in which it's imported) and can be
+        max_workers: maximum number of calls run at once by submit and map
         """
         try:
             with open(f"{path}", "r") as stream:
@@ -28,7 +30,20 @@ class Client():
         self.user_agent = device_info["user_agent"]
         self.device_id = device_info["device_id"]
         self.device_id_sig = device_info["device_id_sig"]
+        self.max_workers = max_workers
+        self.executor = None
+        self._executor_lock = threading.Lock()
+        self.logged_out = False
+        self._sub_clients = weakref.WeakSet()   # SubClients built by sub_clients, whose pools logout cancels
+
+        # every request goes through the session's scheduler, which keeps bulk work from crowding out replies.
+        # one connection per worker, so concurrent calls don't open and drop extra connections
+        self.session = scheduler.ScheduledSession(scheduler.Scheduler(limit = max_workers))
+        self.session.mount("https://", requests.adapters.HTTPAdapter(pool_connections = 4, pool_maxsize = max_workers))
         self.socket = socket.SocketHandler(self, socket_trace = socket_trace)
+        self.directories = {}
+        self.streams = []
+        self.deduplicator = dedup.Deduplicator()
 
         self.callbacks = callback(self)
 
@@ -51,10 +66,10 @@ class Client():
         })
 
         headers = self.headers(data = data)
-        response = requests.post(f"{self.api}/g/s/auth/login", data = data, headers = headers)
+        response = self.session.post(f"{self.api}/g/s/auth/login", data = data, headers = headers)
 
         if response.status_code == 400:
-            response = json.loads(response.text)
+            response = parsing.loads(response.content)
 
             if response["api:statuscode"] == 200:
                 raise exceptions.FailedLogin
@@ -62,8 +77,9 @@ class Client():
             else:
                 raise exceptions.UnknownResponse
 
-        response = json.loads(response.text)
+        response = parsing.loads(response.content)
         self.authenticated = True
+        self.logged_out = False
         self.uid = response["auid"]
         self.secret = response["secret"]
         self.sid = response["sid"]
@@ -75,7 +91,16 @@ class Client():
     def logout(self):
         """
         Send a logout request to amino
+        Calls queued with submit or map on this client or its SubClients that haven't started yet are cancelled,
+        and submit refuses new calls until the next login
         """
+        for sub_client in list(self._sub_clients):
+            sub_client.logged_out = True
+            sub_client.shutdown_executor(cancel = True)
+
+        self.logged_out = True
+        self.shutdown_executor(cancel = True)
+
         data = json.dumps({
             "deviceID": self.device_id,
             "clinetType": 100,
@@ -84,7 +109,60 @@ class Client():
 
         headers = self.headers(data)
 
-        return requests.post(f"{self.api}/g/s/auth/logout", data = data, headers = headers)
+        return self.session.post(f"{self.api}/g/s/auth/logout", data = data, headers = headers)
+
+    def submit(self, fn, *args, **kwargs):
+        """
+        Run a call in this client's thread pool, so that independent requests can overlap.
+        The pool is shared by every call submitted to this client, and runs at most max_workers of them at once.
+        Requests made from the pool share the client's session
+        fn: callable to run, ie sub_client.check_in or lambda: community.member_count
+        args, kwargs: arguments for fn
+        returns a concurrent.futures.Future for the call
+        raises NotLoggedIn after logout
+        """
+        with self._executor_lock:
+            if self.logged_out:
+                raise exceptions.NotLoggedIn
+
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(max_workers = self.max_workers, thread_name_prefix = f"amino-{self.nick}")
+
+            return self.executor.submit(fn, *args, **kwargs)
+
+    def map(self, fn, *iterables, timeout = None):
+        """
+        Run a call for every item in one or more iterables in this client's thread pool, see submit
+        fn: callable to run, ie lambda peer: peer.get_pm_thread()
+        iterables: arguments for fn, the same as for the builtin map
+        timeout: seconds to wait for all of the results, or None to wait for as long as they take
+        returns an iterator over the results in the order of the iterables, raising any exception a call raised
+        """
+        deadline = time() + timeout if timeout is not None else None
+        futures = [self.submit(fn, *args) for args in zip(*iterables)]
+
+        def results():
+            try:
+                for future in futures:
+                    yield future.result(timeout = deadline - time() if deadline is not None else None)
+
+            finally:
+                for future in futures:
+                    future.cancel()
+
+        return results()
+
+    def shutdown_executor(self, cancel = False, wait = False):
+        """
+        Shut down this client's thread pool. A new one is started by the next submit
+        cancel: cancel the calls that haven't started yet
+        wait: wait for the running calls to finish
+        """
+        with self._executor_lock:
+            executor, self.executor = self.executor, None
+
+        if executor is not None:
+            executor.shutdown(wait = wait, cancel_futures = cancel)
 
     def __repr__(self):
         """
@@ -109,7 +187,7 @@ class Client():
 
         headers = self.headers(data)
 
-        response = requests.post(f"{self.api}/g/s/device", headers = headers, data = data)
+        response = self.session.post(f"{self.api}/g/s/device", headers = headers, data = data)
 
         if response.status_code == 200:
             self.configured = True
@@ -154,20 +232,39 @@ class Client():
         }
 
         headers = self.headers()
-        response = requests.get(f"{self.api}/g/s/community/joined", params = params, headers = headers)
+        response = self.session.get(f"{self.api}/g/s/community/joined", params = params, headers = headers, priority = scheduler.BACKGROUND)
 
         if response.status_code != 200:
             raise exceptions.UnknownResponse
 
-        response = json.loads(response.text)
+        response = parsing.loads(response.content)
         clients = {}
 
         for data in response["communityList"]:
             profile = response["userInfoInCommunities"][str(data["ndcId"])]["userProfile"]
-            clients[data["endpoint"]] = SubClient(profile, self.sid, community.Community(data))
+            # hand over the community's existing directory, so what it collected outlives this SubClient
+            sub_client = SubClient(profile, self.sid, community.Community(data, self), peer_directory = self.directories.get(data["ndcId"]))
+            sub_client.session = self.session   # share connections and scheduling with this client
+            self._sub_clients.add(sub_client)
+            self.add_directory(data["ndcId"], sub_client.directory)
+            clients[data["endpoint"]] = sub_client
 
         return clients
 
+    def add_directory(self, ndcid, peer_directory):
+        """
+        Register the PeerDirectory for a community, so it's kept up to date from this client's socket.
+        A different directory already registered for the community has its refresh thread stopped
+        ndcid: id of the community
+        peer_directory: the PeerDirectory
+        """
+        previous = self.directories.get(ndcid)
+
+        if previous is not None and previous is not peer_directory:
+            previous.stop_refresh()
+
+        self.directories[ndcid] = peer_directory
+
     def upload_image_path(self, path, type = None):
         """
         Upload an image that exists on the disk (by propogating the file data to upload_image_raw)
@@ -190,14 +287,46 @@ class Client():
         """
         headers = self.headers(data)
         headers["Content-Type"] = f"image/{type}"
-        response = requests.post(f"{self.api}/g/s/media/upload", data = data, headers = headers)
+        response = self.session.post(f"{self.api}/g/s/media/upload", data = data, headers = headers, priority = scheduler.BACKGROUND)
 
         if response.status_code != 200:
             raise exceptions.UnknownResponse
 
-        return json.loads(response.text)["mediaValue"]
+        return parsing.loads(response.content)["mediaValue"]
+
+    def events(self, maxsize = 1000, overflow = events.BLOCK, drop_types = None, communities = None, threads = None, types = None):
+        """
+        Open a stream of decoded socket events, as an alternative to subclassing Callbacks.
+        The stream can be consumed with a for loop or an async for loop, and is closed with its close method.
+        Callbacks are still called for every event while a stream is open
+        See events.EventStream for the parameters
+        returns an EventStream
+        """
+        stream = events.EventStream(
+            maxsize = maxsize,
+            overflow = overflow,
+            drop_types = drop_types,
+            communities = communities,
+            threads = threads,
+            types = types,
+            on_close = self.streams.remove
+        )
+
+        self.streams.append(stream)
+        return stream
 
     def handle_socket_message(self, data):
+        data = parsing.loads(data)
+
+        if self.deduplicator.is_duplicate(data):
+            return
+
+        for peers in self.directories.values():
+            peers.observe(data)
+
+        for stream in list(self.streams):
+            stream.put(data)
+
         return self.callbacks.resolve(data)
 
 class SubClient(Client):
@@ -205,13 +334,14 @@ class SubClient(Client):
     A representation of a user on an amino.
     This is different than the parent Client, as amino has different account info for each amino that a user has joined
     """
-    def __init__(self, user_data, sid, community_obj):
+    def __init__(self, user_data, sid, community_obj, peer_directory = None):
         """
         Build the client.
         user_data: json info with the user info to build the info from
         sid: the client's sid. This is needed for forming any post-login requests (ie all of them)
         community_data: json info representing the community that the client is attached to
         community_obj: an object representing the community that the client is attached to. Takes precedence over community_data
+        peer_directory: an existing PeerDirectory for the community to take over, or None to start an empty one
         """
         Client.__init__(self)
         if not community and not community_data:
@@ -222,32 +352,74 @@ class SubClient(Client):
         self.nick = user_data["nickname"]
         self.sid = sid
 
-    def peer_search(self, query = None, type = "all"):
+        if peer_directory is not None:
+            peer_directory.client = self
+            self.directory = peer_directory
+
+        else:
+            self.directory = directory.PeerDirectory(self, community_obj)
+
+    def peer_search(self, query = None, type = "all", start = 0, size = 25, directory = True):
         """
         Search for peers on this clients amino community.
 
         query: search search string, or none for an unfiltered search
         type: I don't know, but it's in the api
+        start: offset into the results, for paging
+        size: number of results to request
+        directory: whether the peers found should also be added to this client's PeerDirectory
+        """
+        headers = self.headers()
+        params = self._peer_search_params(query, type, start, size)
+
+        response = self.session.get(f"{self.api}/x{self.community.id}/s/user-profile", params = params, headers = headers, priority = scheduler.BACKGROUND)
+
+        if response.status_code != 200:
+            raise exceptions.UnknownResponse
+
+        response = parsing.loads(response.content)
+        peers = [community.Peer(item, self, community_obj = self.community) for item in response["userProfileList"]]
+
+        if directory:
+            for peer in peers:
+                self.directory.add(peer)
+
+        return peers
+
+    def iter_peer_search(self, query = None, type = "all", start = 0, size = 25, directory = True, chunk_size = 16384):
+        """
+        Search for peers like peer_search, but decode the results while they are downloaded.
+        Only one profile is held in memory at a time, so this is meant for large pages
+        chunk_size: number of bytes read from the response at a time
+        yields each Peer as soon as it's decoded
         """
         headers = self.headers()
+        params = self._peer_search_params(query, type, start, size)
 
+        with self.session.get(f"{self.api}/x{self.community.id}/s/user-profile", params = params, headers = headers, stream = True, priority = scheduler.BACKGROUND) as response:
+            if response.status_code != 200:
+                raise exceptions.UnknownResponse
+
+            for item in parsing.iter_items(response.iter_content(chunk_size), "userProfileList"):
+                peer = community.Peer(item, self, community_obj = self.community)
+
+                if directory:
+                    self.directory.add(peer)
+
+                yield peer
+
+    @staticmethod
+    def _peer_search_params(query, type, start, size):
         params = {
-            "start": 0,
-            "size": 25,
+            "start": start,
+            "size": size,
             "type": type
         }
 
         if query:
             params["q"] = query
 
-        response = requests.get(f"{self.api}/x{self.community.id}/s/user-profile", params = params)
-
-        if response.status_code != 200:
-            raise exceptions.UnknownResponse
-
-        response = json.loads(response.text)
-
-        return [community.Peer(item, self, community_obj = self.community) for item in response["userProfileList"]]
+        return params
 
     def post_blog(self, title, body, *media):
         """
@@ -284,7 +456,7 @@ class SubClient(Client):
 
         headers = self.headers(data)
 
-        return requests.post(f"{self.api}/x{self.community.id}/s/blog", headers = headers, data = data)
+        return self.session.post(f"{self.api}/x{self.community.id}/s/blog", headers = headers, data = data)
 
     def check_in(self):
         data = json.dumps({
@@ -294,7 +466,7 @@ class SubClient(Client):
 
         headers = self.headers(data)
 
-        response = requests.post(f"{self.api}/x{self.community.id}/s/check-in", headers = headers, data = data)
+        response = self.session.post(f"{self.api}/x{self.community.id}/s/check-in", headers = headers, data = data, priority = scheduler.BACKGROUND)
 
         return response
 
@@ -304,22 +476,109 @@ class SubClient(Client):
         Get a list of the threads that this client is a part of
         returns a list of Thread objects
         """
-        params = {
-            "type": "joined-me",
-            "start": 0,
-        }
+        return self.get_chat_threads()
 
+    def get_chat_threads(self, start = 0, size = None):
+        """
+        Get a page of the threads that this client is a part of
+        start: offset into the thread list, for paging
+        size: number of threads to request, or None for the server default
+        returns a list of Thread objects
+        """
+        params = self._chat_thread_params(start, size)
         headers = self.headers()
 
-        response = requests.get(f"{self.api}/x{self.community.id}/s/chat/thread", params = params, headers = headers)
+        response = self.session.get(f"{self.api}/x{self.community.id}/s/chat/thread", params = params, headers = headers)
 
         if response.status_code != 200:
-            raise UnknownResponse # placeholder
+            raise exceptions.UnknownResponse
 
-        response = json.loads(response.text)["threadList"]
+        response = parsing.loads(response.content)["threadList"]
 
         return [community.ChatThread(response[index], self) for index in range(len(response))]
 
+    def iter_chat_threads(self, start = 0, size = None, chunk_size = 16384):
+        """
+        Get a page of the threads that this client is a part of like get_chat_threads,
+        but decode them while they are downloaded, holding only one thread in memory at a time
+        chunk_size: number of bytes read from the response at a time
+        yields each Thread as soon as it's decoded
+        """
+        params = self._chat_thread_params(start, size)
+        headers = self.headers()
+
+        with self.session.get(f"{self.api}/x{self.community.id}/s/chat/thread", params = params, headers = headers, stream = True) as response:
+            if response.status_code != 200:
+                raise exceptions.UnknownResponse
+
+            for item in parsing.iter_items(response.iter_content(chunk_size), "threadList"):
+                yield community.ChatThread(item, self)
+
+    @staticmethod
+    def _chat_thread_params(start, size):
+        params = {
+            "type": "joined-me",
+            "start": start,
+        }
+
+        if size:
+            params["size"] = size
+
+        return params
+
+    def resolve_pm_threads(self, peers, page_size = 100, max_pages = None):
+        """
+        Find the pm threads for many peers at once, by walking this client's thread list
+        rather than requesting each peer's thread separately.
+        peers: iterable of Peers to find threads for
+        page_size: number of threads to request per page
+        max_pages: maximum number of pages to request, or None to walk the whole list
+        returns a (threads, complete) tuple. threads is a dict with uid:ChatThread for every peer found to have
+        an open pm thread, and complete is True if the lookup was exhaustive, so a peer missing from threads has none
+        """
+        wanted = {peer.uid for peer in peers}
+        threads = {}
+        start = 0
+        pages = 0
+
+        while wanted - threads.keys():
+            if max_pages is not None and pages >= max_pages:
+                return threads, False
+
+            pages += 1
+            page = self.get_chat_threads(start = start, size = page_size)
+
+            for thread in page:
+                if thread.type != 0:
+                    continue
+
+                for uid, _ in thread._members:
+                    if uid in wanted and uid != self.uid:
+                        threads[uid] = thread
+
+            if len(page) < page_size:
+                break
+
+            start += page_size
+
+        return threads, True
+
+    def broadcast(self, targets, message, workers = None, allow_new = False, checkpoint = None):
+        """
+        Send a text message to many Peers and ChatThreads concurrently.
+        Peers' pm threads are resolved in bulk first, and the sends are spread over a bounded pool of threads.
+        targets: iterable of Peer and ChatThread objects
+        message: message to send to every target
+        workers: number of threads sending messages, or None for as many as the scheduler lets BACKGROUND requests run
+                 at once (max_workers // 2 by default). Sends run at BACKGROUND priority, so the scheduler's cap
+                 for that class limits them whatever this is set to
+        allow_new: if a peer has no open thread, send them a chat request instead of reporting no thread
+        checkpoint: optional path to a json file recording finished targets. Targets already recorded there are skipped,
+                    so an interrupted broadcast can be resumed by calling this again with the same path
+        returns a list of BroadcastResults, in the same order as targets
+        """
+        return broadcast.broadcast(self, targets, message, workers = workers, allow_new = allow_new, checkpoint = checkpoint)
+
     @property
     def private_chat_threads(self):
         return self.chat_threads()
@@ -1,28 +1,48 @@
-import requests, json
+import json
 from time import time
-from amino.lib.util import exceptions
+from amino.lib.util import exceptions, helpers, parsing, scheduler
 
 class Community():
+    __slots__ = ("name", "endpoint", "url", "id", "client", "__weakref__")
     api = "https://service.narvii.com/api/v1"
-    def __init__(self, community_data):
+    _shared_session = None  # used by communities built without a client
+    def __init__(self, community_data, client = None):
         """
         Build the community
         community_data: json info representing the community to be objectified
+        client: client whose session the community's requests go through, or None for a session shared by
+                every community built without one
         """
-        self.api = Community.api
         self.name = community_data["name"]
         self.endpoint = community_data["endpoint"]
         self.url = community_data["link"]
         self.id = community_data["ndcId"]
+        self.client = client
+
+    @classmethod
+    def _session(cls, client):
+        if client is not None:
+            return client.session
+
+        if cls._shared_session is None:
+            cls._shared_session = scheduler.ScheduledSession()
+
+        return cls._shared_session
 
     @classmethod
-    def from_ndcid(cls, ndcid):
-        response = requests.get(f"{cls.api}/g/s-x{ndcid}/community/info")
+    def from_ndcid(cls, ndcid, client = None):
+        """
+        Request a community's info and build it
+        ndcid: id of the community
+        client: client whose session the request goes through, passed on to the community
+        returns the Community
+        """
+        response = cls._session(client).get(f"{cls.api}/g/s-x{ndcid}/community/info")
 
         if response.status_code != 200:
             raise exceptions.UnknownResponse
 
-        return cls(json.loads(response))
+        return cls(parsing.loads(response.content)["community"], client)
 
     @property
     def member_count(self):
@@ -30,12 +50,12 @@ class Community():
         Param: Get the number of members in this community
         returns the member count for the community
         """
-        response = requests.get(f"{self.api}/g/s-x{self.id}/community/info")
+        response = self._session(self.client).get(f"{self.api}/g/s-x{self.id}/community/info")
 
         if response.status_code != 200:
             raise exceptions.UnknownResponse
 
-        return json.loads(response.text)["community"]["membersCount"]
+        return parsing.loads(response.content)["community"]["membersCount"]
 
     def __repr__(self):
         """
@@ -44,7 +64,9 @@ class Community():
         return f"{self.name}"
 
 class Peer():
+    __slots__ = ("community", "client", "uid", "nick", "_raw", "__weakref__")
     api = "https://service.narvii.com/api/v1"
+    keep_payload = True     # set to False to drop the raw payload once the hot fields are extracted
     def __init__(self, user_data, client, community_obj):
         """
         Build the peer.
@@ -52,12 +74,19 @@ class Peer():
         client: logged in client or sub_client who the peer belongs to
         community_obj: an object representing the community that the peer is attached to
         """
-        self.api = Peer.api
         self.community = community_obj
         self.client = client
         self.uid = user_data["uid"]
         self.nick = user_data["nickname"]
-        self._data = user_data
+        self._raw = helpers.pack(user_data) if self.keep_payload else None
+
+    @property
+    def _data(self):
+        """
+        The json representing the peer, decoded from its packed payload on every access.
+        returns the payload, or None if it was dropped
+        """
+        return helpers.unpack(self._raw)
 
     def __repr__(self):
         """
@@ -87,12 +116,12 @@ class Peer():
 
         headers = self.client.headers()
 
-        response = requests.get(f"{self.client.api}/x{self.community.id}/s/chat/thread", params = params, headers = headers)
+        response = self.client.session.get(f"{self.client.api}/x{self.community.id}/s/chat/thread", params = params, headers = headers)
 
         if response.status_code == 200:
-            return ChatThread(json.loads(response.text)["threadList"][0], self.client)
+            return ChatThread(parsing.loads(response.content)["threadList"][0], self.client)
 
-        elif json.loads(response.text).get("api:statuscode", False) == 1600:
+        elif parsing.loads(response.content).get("api:statuscode", False) == 1600:
             return None
 
         else: raise exceptions.UnknownResponse
@@ -117,9 +146,9 @@ class Peer():
         data = json.dumps(data)
         headers = self.client.headers(data)
 
-        response = requests.post(f"{self.client.api}/x{self.community.id}/s/chat/thread", data = data, headers = headers)
+        response = self.client.session.post(f"{self.client.api}/x{self.community.id}/s/chat/thread", data = data, headers = headers)
 
-        if response["api:statuscode"] == 1611:
+        if response.status_code != 200 and parsing.loads(response.content).get("api:statuscode") == 1611:
             raise exceptions.ChatRequestsBlocked
 
         return response
@@ -151,41 +180,65 @@ class Peer():
 
         headers = self.client.headers(data)
 
-        return requests.post(
+        return self.client.session.post(
             f"{self.client.api}/x{self.community.id}/s/chat/thread/{self.uid}/message",
             data = data,
             headers = headers
         )
 
 class ChatThread():
+    __slots__ = ("client", "uid", "_community_id", "type", "_members", "_members_raw", "member_count", "__weakref__")
+    api = "https://service.narvii.com/api/v1"
+    keep_payload = True     # set to False to drop the raw member summary once uids and nicknames are extracted
     def __init__(self, data, client):
         """
         Build the client.
         """
-        self.api = "https://service.narvii.com/api/v1"
         self.client = client
         self.uid = data["threadId"]
         self._community_id = data["ndcId"]
-        self._members_data = data["membersSummary"]   # create a Peer object for each item in the list
-        self.member_count = len(self._members_data)
+        self.type = data.get("type")
+        self._members = tuple((item["uid"], item["nickname"]) for item in data["membersSummary"])
+        self._members_raw = helpers.pack(data["membersSummary"]) if self.keep_payload else None
+        self.member_count = len(self._members)
+
+    @property
+    def _members_data(self):
+        """
+        The thread's member summary, decoded from its packed payload on every access.
+        If the payload was dropped, only the uid and nickname of each member are available
+        """
+        if self._members_raw is None:
+            return [{"uid": uid, "nickname": nick} for uid, nick in self._members]
+
+        return helpers.unpack(self._members_raw)
 
     def __repr__(self):
         return self.uid
 
     @property
     def community(self):
-        response = requests.get(f"{self.api}/g/s-x{self._community_id}/community/info")
+        response = self.client.session.get(f"{self.api}/g/s-x{self._community_id}/community/info")
 
         if response.status_code != 200:
             raise exceptions.UnknownResponse
 
-        response = json.loads(response.text)
-        return Community(response["community"])
+        response = parsing.loads(response.content)
+        return Community(response["community"], self.client)
 
     @property
     def members(self):
-        _members = [Peer(self._members_data[index], self.client, self.community) for index in range(len(self._members_data))]
-        return list(filter(lambda x: x.uid != self.client.uid, _members))
+        directory = getattr(self.client, "directory", None)
+
+        if directory is not None and directory.community.id == self._community_id:
+            directory.add_thread(self)
+            return [directory.get(uid) for uid, _ in self._members if uid != self.client.uid]
+
+        # both of these are worked out on access, so only do it once
+        members_data = self._members_data
+        community_obj = self.community
+
+        return [Peer(item, self.client, community_obj) for item in members_data if item["uid"] != self.client.uid]
 
     def send_text_message(self, message):
         timestamp = int(time() * 1000)
@@ -200,16 +253,18 @@ class ChatThread():
 
         headers = self.client.headers(data)
 
-        return requests.post(
+        return self.client.session.post(
             f"{self.client.api}/x{self._community_id}/s/chat/thread/{self.uid}/message",
             data = data,
-            headers = headers
+            headers = headers,
+            priority = scheduler.INTERACTIVE
         )
 
 class Message:
     """
     Build a message.
     """
+    __slots__ = ("client", "uid", "created", "content", "_community_id", "_thread_id", "_author_raw", "__weakref__")
     api = "https://service.narvii.com/api/v1"
     def __init__(self, data, client):
         self.client = client
@@ -218,16 +273,20 @@ class Message:
         self.content = data["content"]
 
         self._community_id = data["author"]["ndcId"]
-        self._author = data["author"]
+        self._author_raw = helpers.pack(data["author"])
         self._thread_id = data["threadId"]
 
+    @property
+    def _author(self):
+        return helpers.unpack(self._author_raw)
+
     @property
     def community(self):
-        return Community.from_ndcid(self._community_id)
+        return Community.from_ndcid(self._community_id, self.client)
 
     @property
     def author(self):
-        return Peer(self._author, client, self.community)
+        return Peer(self._author, self.client, self.community)
 
     def mark_as_delivered(self):
         timestamp = int(time() * 1000)
@@ -271,7 +330,7 @@ class Message:
 
         headers = self.client.headers(data)
 
-        result = requests.post(f"{self.api}/x{self._community_id}/s/chat/thread/{self._thread_id}/mark-as-read", headers = headers, data = data)
+        result = self.client.session.post(f"{self.api}/x{self._community_id}/s/chat/thread/{self._thread_id}/mark-as-read", headers = headers, data = data)
 
         return result
 
@@ -288,8 +347,9 @@ class Message:
 
         headers = self.client.headers(data)
 
-        return requests.post(
+        return self.client.session.post(
             f"{self.client.api}/x{self._community_id}/s/chat/thread/{self._thread_id}/message",
             data = data,
-            headers = headers
+            headers = headers,
+            priority = scheduler.INTERACTIVE
         )
@@ -0,0 +1,262 @@
+import threading
+from bisect import bisect_left, insort
+from amino import community
+
+class PeerDirectory():
+    def __init__(self, client, community_obj):
+        """
+        Build a local directory of the peers in a community.
+        Peers are collected from paginated peer listings, thread member summaries and socket events,
+        and indexed in memory so that nickname and uid lookups don't need a request.
+        client: logged in sub_client that owns the community
+        community_obj: an object representing the community that the directory is for
+        """
+        self.client = client
+        self.community = community_obj
+        self._lock = threading.RLock()
+        self._peers = {}        # uid:Peer
+        self._nicks = []        # sorted list of (folded nickname, uid), for prefix search
+        self._grams = {}        # trigram:set of uids, for substring search
+        self._refresh_thread = None
+        self._refresh_stop = threading.Event()
+
+    def __len__(self):
+        return len(self._peers)
+
+    def __contains__(self, uid):
+        return uid in self._peers
+
+    def __repr__(self):
+        return f"PeerDirectory({self.community}, {len(self)} peers)"
+
+    @staticmethod
+    def _fold(nick):
+        return (nick or "").casefold()
+
+    @staticmethod
+    def _trigrams(folded):
+        return {folded[index:index + 3] for index in range(len(folded) - 2)}
+
+    def _unindex(self, peer):
+        folded = self._fold(peer.nick)
+        index = bisect_left(self._nicks, (folded, peer.uid))
+
+        if index < len(self._nicks) and self._nicks[index] == (folded, peer.uid):
+            del self._nicks[index]
+
+        for gram in self._trigrams(folded):
+            uids = self._grams.get(gram)
+
+            if uids is not None:
+                uids.discard(peer.uid)
+
+                if not uids:
+                    del self._grams[gram]
+
+    def _index(self, peer):
+        folded = self._fold(peer.nick)
+        insort(self._nicks, (folded, peer.uid))
+
+        for gram in self._trigrams(folded):
+            self._grams.setdefault(gram, set()).add(peer.uid)
+
+    def add(self, peer):
+        """
+        Add a peer to the directory, or update the one with the same uid.
+        peer: Peer object to add
+        returns True if the directory changed, False if the peer was already known with the same nickname
+        """
+        with self._lock:
+            known = self._peers.get(peer.uid)
+
+            if known is not None:
+                if known.nick == peer.nick:
+                    self._peers[peer.uid] = peer
+                    return False
+
+                self._unindex(known)
+
+            self._peers[peer.uid] = peer
+            self._index(peer)
+            return True
+
+    def add_data(self, user_data):
+        """
+        Add a peer to the directory from its json representation.
+        A peer already known under the same nickname is left alone without building a new Peer,
+        since this runs for every chat message the socket receives
+        user_data: json representing the peer, as found in userProfileList, membersSummary or a message author
+        returns True if the directory changed
+        """
+        if not user_data or "uid" not in user_data or "nickname" not in user_data:
+            return False
+
+        known = self._peers.get(user_data["uid"])
+
+        if known is not None and known.nick == user_data["nickname"]:
+            return False
+
+        return self.add(community.Peer(user_data, self.client, community_obj = self.community))
+
+    def add_thread(self, thread):
+        """
+        Add every member of a chat thread to the directory.
+        Members that are already known under the same nickname are left alone, so the thread's member summary
+        is only decoded if there is a new or renamed member, and then only once
+        thread: ChatThread object in this directory's community
+        returns the number of peers that were added or updated
+        """
+        changed = 0
+        members_data = None
+
+        for index, (uid, nick) in enumerate(thread._members):
+            known = self._peers.get(uid)
+
+            if known is not None and known.nick == nick:
+                continue
+
+            if members_data is None:
+                members_data = thread._members_data
+
+            changed += self.add(community.Peer(members_data[index], self.client, community_obj = self.community))
+
+        return changed
+
+    def observe(self, data):
+        """
+        Update the directory from a decoded socket frame.
+        The author of any chat message or member join in this community is added
+        data: decoded socket frame
+        """
+        if data.get("t") != 1000:
+            return False
+
+        if data["o"].get("ndcId") != self.community.id:
+            return False
+
+        return self.add_data(data["o"]["chatMessage"].get("author"))
+
+    def remove(self, uid):
+        """
+        Remove a peer from the directory.
+        uid: uid of the peer to be removed
+        returns the removed Peer, or None if it wasn't known
+        """
+        with self._lock:
+            peer = self._peers.pop(uid, None)
+
+            if peer is not None:
+                self._unindex(peer)
+
+            return peer
+
+    def get(self, uid, default = None):
+        """
+        Look up a peer by uid.
+        uid: uid of the peer
+        returns the Peer, or default if it isn't known
+        """
+        return self._peers.get(uid, default)
+
+    def prefix(self, query, limit = None):
+        """
+        Find peers whose nickname starts with a string. Matching is case insensitive
+        query: nickname prefix to search for
+        limit: maximum number of peers to return, or None for all of them
+        returns a list of Peers ordered by nickname
+        """
+        folded = self._fold(query)
+        found = []
+
+        with self._lock:
+            index = bisect_left(self._nicks, (folded, ""))
+
+            while index < len(self._nicks) and self._nicks[index][0].startswith(folded):
+                if limit is not None and len(found) >= limit:
+                    break
+
+                found.append(self._peers[self._nicks[index][1]])
+                index += 1
+
+        return found
+
+    def search(self, query, limit = None):
+        """
+        Find peers whose nickname contains a string. Matching is case insensitive
+        query: nickname substring to search for
+        limit: maximum number of peers to return, or None for all of them
+        returns a list of Peers ordered by nickname
+        """
+        folded = self._fold(query)
+
+        with self._lock:
+            if len(folded) < 3:
+                candidates = self._peers.values()
+
+            else:
+                grams = sorted((self._grams.get(gram, set()) for gram in self._trigrams(folded)), key = len)
+                candidates = [self._peers[uid] for uid in set.intersection(*grams)]
+
+            found = sorted((peer for peer in candidates if folded in self._fold(peer.nick)), key = lambda peer: (self._fold(peer.nick), peer.uid))
+
+        return found[:limit] if limit is not None else found
+
+    def fill(self, size = 100, type = "recent", incremental = False, max_pages = None):
+        """
+        Fill the directory from the community's paginated peer listing.
+        size: number of peers to request per page
+        type: listing type passed on to SubClient.peer_search
+        incremental: stop at the first page that brings nothing new, rather than walking the whole listing
+        max_pages: maximum number of pages to request, or None for no limit
+        returns the number of peers that were added or updated
+        """
+        changed = 0
+        start = 0
+        pages = 0
+
+        while max_pages is None or pages < max_pages:
+            page = self.client.peer_search(type = type, start = start, size = size, directory = False)
+            page_changed = sum(self.add(peer) for peer in page)
+            changed += page_changed
+            pages += 1
+
+            if len(page) < size or (incremental and not page_changed):
+                break
+
+            start += size
+
+        return changed
+
+    def _refresh_loop(self, interval, size, type):
+        while not self._refresh_stop.wait(interval):
+            try:
+                self.fill(size = size, type = type, incremental = True)
+
+            except Exception:
+                # a failed refresh shouldn't kill the thread, the next one will pick up where this left off
+                pass
+
+    def start_refresh(self, interval = 300, size = 100, type = "recent"):
+        """
+        Start refreshing the directory incrementally in a background thread.
+        interval: seconds between refreshes
+        size: number of peers to request per page
+        type: listing type passed on to SubClient.peer_search
+        """
+        if self._refresh_thread and self._refresh_thread.is_alive():
+            return
+
+        self._refresh_stop.clear()
+        self._refresh_thread = threading.Thread(target = self._refresh_loop, args = (interval, size, type), daemon = True)
+        self._refresh_thread.start()
+
+    def stop_refresh(self):
+        """
+        Stop the background refresh thread, if there is one.
+        """
+        self._refresh_stop.set()
+
+        if self._refresh_thread and self._refresh_thread is not threading.current_thread():
+            self._refresh_thread.join()
+
+        self._refresh_thread = None
@@ -0,0 +1,248 @@
+import asyncio, threading
+from collections import deque
+
+BLOCK = "block"
+DROP_OLDEST = "drop-oldest"
+DROP_BY_TYPE = "drop-by-type"
+
+def event_type(data):
+    """
+    Get the type of a decoded socket frame.
+    Chat messages use the same `type:mediaType` keys as Callbacks.chat_methods, anything else uses its `t` parameter
+    """
+    if data.get("t") == 1000:
+        message = data["o"]["chatMessage"]
+        return f"{message['type']}:{message.get('mediaType', 0)}"
+
+    return str(data.get("t"))
+
+class EventStream():
+    def __init__(self, maxsize = 1000, overflow = BLOCK, drop_types = None, communities = None, threads = None, types = None, on_close = None):
+        """
+        Build a bounded stream of socket events, to be consumed with a for or async for loop.
+        maxsize: maximum number of events buffered before the overflow policy applies
+        overflow: what to do with a new event when the stream is full
+                  BLOCK holds up the socket until the consumer catches up
+                  DROP_OLDEST discards the oldest buffered event
+                  DROP_BY_TYPE discards the new event if its type is in drop_types, or else the oldest buffered event
+                  whose type is, blocking if there are none
+        drop_types: event types that may be discarded under DROP_BY_TYPE, see event_type
+        communities: ndcIds to accept events from, or None for all of them
+        threads: thread ids to accept events from, or None for all of them
+        types: event types to accept, or None for all of them
+        on_close: called with the stream when it's closed
+        Filtered events are discarded before they are buffered, so they never take up space in the stream
+        """
+        if overflow not in (BLOCK, DROP_OLDEST, DROP_BY_TYPE):
+            raise ValueError(f"unknown overflow policy {overflow}")
+
+        if maxsize < 1:
+            raise ValueError(f"maxsize has to be at least 1, got {maxsize}")
+
+        self.maxsize = maxsize
+        self.overflow = overflow
+        self.drop_types = set(drop_types or ())
+        self.communities = set(communities) if communities is not None else None
+        self.threads = set(threads) if threads is not None else None
+        self.types = set(types) if types is not None else None
+        self.closed = False
+        self.dropped = 0
+        self._on_close = on_close
+        self._queue = deque()
+        self._condition = threading.Condition()
+        self._waiters = deque()     # (loop, future) of async consumers waiting for an event
+
+    def __len__(self):
+        return len(self._queue)
+
+    def accepts(self, data):
+        """
+        Check a decoded socket frame against this stream's filters
+        """
+        body = data.get("o") or {}
+
+        if self.communities is not None and body.get("ndcId") not in self.communities:
+            return False
+
+        if self.threads is not None:
+            thread_id = body.get("threadId") or (body.get("chatMessage") or {}).get("threadId")
+
+            if thread_id not in self.threads:
+                return False
+
+        return self.types is None or event_type(data) in self.types
+
+    def _make_room(self, kind):
+        """
+        Apply the overflow policy to a full queue.
+        returns False if the new event should be dropped, True once it can be appended
+        """
+        while len(self._queue) >= self.maxsize and not self.closed:
+            if self.overflow == DROP_OLDEST:
+                self._queue.popleft()
+                self.dropped += 1
+                return True
+
+            if self.overflow == DROP_BY_TYPE:
+                if kind in self.drop_types:
+                    self.dropped += 1
+                    return False
+
+                for index, (queued_kind, _) in enumerate(self._queue):
+                    if queued_kind in self.drop_types:
+                        del self._queue[index]
+                        self.dropped += 1
+                        return True
+
+            self._condition.wait()
+
+        return not self.closed
+
+    def put(self, data):
+        """
+        Offer a decoded socket frame to the stream.
+        returns True if the event was buffered
+        """
+        if self.closed or not self.accepts(data):
+            return False
+
+        kind = event_type(data)
+
+        with self._condition:
+            if not self._make_room(kind):
+                return False
+
+            self._queue.append((kind, data))
+            self._hand_over()
+            self._condition.notify_all()
+            return True
+
+    def _hand_over(self):
+        """
+        Pass buffered events straight to waiting async consumers, on their own event loops.
+        Must be called with the condition held
+        """
+        while self._queue and self._waiters:
+            loop, future = self._waiters.popleft()
+
+            if future.done():
+                continue
+
+            item = self._queue.popleft()
+
+            try:
+                loop.call_soon_threadsafe(self._deliver, future, item)
+
+            except RuntimeError:
+                # the consumer's loop is closed, keep the event for someone else
+                self._queue.appendleft(item)
+
+    def _deliver(self, future, item):
+        """
+        Resolve an async consumer's future, on its event loop. An event meant for a consumer that was
+        cancelled in the meantime goes back to the front of the stream
+        """
+        if future.cancelled():
+            self._put_back(item)
+            return
+
+        future.set_result(item[1])
+
+    def _put_back(self, item):
+        with self._condition:
+            self._queue.appendleft(item)
+            self._hand_over()
+            self._condition.notify_all()
+
+    def get(self, timeout = None):
+        """
+        Take the next event from the stream, waiting for one if it's empty.
+        timeout: seconds to wait, or None to wait until an event arrives or the stream is closed
+        returns the decoded event, or None if the stream was closed or the timeout passed
+        """
+        with self._condition:
+            if not self._condition.wait_for(lambda: self._queue or self.closed, timeout = timeout):
+                return None
+
+            if not self._queue:
+                return None
+
+            _, data = self._queue.popleft()
+            self._condition.notify_all()
+            return data
+
+    def close(self):
+        """
+        Close the stream. Iteration ends once the buffered events are consumed
+        """
+        with self._condition:
+            if self.closed:
+                return
+
+            self.closed = True
+            self._condition.notify_all()
+
+            for loop, future in self._waiters:
+                try:
+                    loop.call_soon_threadsafe(lambda future = future: future.done() or future.set_result(None))
+
+                except RuntimeError:
+                    pass
+
+            self._waiters.clear()
+
+        if self._on_close:
+            self._on_close(self)
+
+    def __iter__(self):
+        while True:
+            data = self.get()
+
+            if data is None:
+                return
+
+            yield data
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        loop = asyncio.get_running_loop()
+
+        with self._condition:
+            if self._queue:
+                _, data = self._queue.popleft()
+                self._condition.notify_all()
+                return data
+
+            if self.closed:
+                raise StopAsyncIteration
+
+            future = loop.create_future()
+            waiter = (loop, future)
+            self._waiters.append(waiter)
+
+        try:
+            data = await future
+
+        except asyncio.CancelledError:
+            with self._condition:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+
+            # the event may have been handed over just as the wait was cancelled
+            if future.done() and not future.cancelled() and future.result() is not None:
+                self._put_back((event_type(future.result()), future.result()))
+
+            raise
+
+        if data is None:
+            raise StopAsyncIteration
+
+        return data
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -0,0 +1,82 @@
+import threading
+from collections import OrderedDict
+from time import monotonic
+
+def message_id(data):
+    """
+    Get the key a decoded socket frame is deduplicated by.
+    returns the chat message's messageId, or None for frames that shouldn't be deduplicated
+    """
+    if data.get("t") != 1000:
+        return None
+
+    return data["o"]["chatMessage"].get("messageId")
+
+class Deduplicator():
+    def __init__(self, max_size = 10000, ttl = 600):
+        """
+        Build a filter that suppresses socket frames that were already seen, such as messages repeated around a reconnect.
+        Keys are kept in least recently seen order, so both kinds of eviction only ever look at the oldest key
+        max_size: maximum number of keys remembered at once, the least recently seen key is forgotten past this
+        ttl: seconds a key is remembered after it was last seen, or None to only evict by size
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self.passed = 0
+        self.suppressed = 0
+        self.evicted = 0
+        self._seen = OrderedDict()  # key:time last seen
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._seen)
+
+    def is_duplicate(self, data):
+        """
+        Check a decoded socket frame, remembering its key.
+        data: decoded socket frame
+        returns True if a frame with the same key was seen recently and this one should be dropped
+        """
+        key = message_id(data)
+
+        if key is None:
+            return False
+
+        now = monotonic()
+
+        with self._lock:
+            if self.ttl is not None:
+                while self._seen and now - next(iter(self._seen.values())) > self.ttl:
+                    self._seen.popitem(last = False)
+                    self.evicted += 1
+
+            duplicate = key in self._seen
+            self._seen[key] = now
+            self._seen.move_to_end(key)
+
+            if duplicate:
+                self.suppressed += 1
+                return True
+
+            if len(self._seen) > self.max_size:
+                self._seen.popitem(last = False)
+                self.evicted += 1
+
+            self.passed += 1
+            return False
+
+    def clear(self):
+        with self._lock:
+            self._seen.clear()
+
+    @property
+    def stats(self):
+        """
+        returns a dict with the filter's counters
+        """
+        return {
+            "passed": self.passed,
+            "suppressed": self.suppressed,
+            "evicted": self.evicted,
+            "size": len(self._seen)
+        }
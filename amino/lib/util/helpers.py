@@ -1,3 +1,4 @@
+import json
 from secrets import token_hex
 def generate_device_info():
     # I'm still trying to figure out how to generate the device id. So far, decompilation is prooving difficult,
@@ -7,3 +8,23 @@ def generate_device_info():
         "device_id_sig": "AaauX/ZA2gM3ozqk1U5j6ek89SMu",
         "user_agent": "Dalvik/2.1.0 (Linux; U; Android 6.0; LG-UK495 Build/MRA58K; com.narvii.amino.master/2.0.24532)"
     }
+
+def pack(data):
+    """
+    Pack a json payload into compact bytes, for keeping around without holding on to the decoded objects.
+    returns the payload as utf-8 encoded json, or None if data is None
+    """
+    if data is None:
+        return None
+
+    return json.dumps(data, separators = (",", ":"), ensure_ascii = False).encode("utf-8")
+
+def unpack(raw):
+    """
+    Decode a payload packed with pack.
+    returns the decoded json, or None if raw is None
+    """
+    if raw is None:
+        return None
+
+    return json.loads(raw)
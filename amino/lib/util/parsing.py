@@ -0,0 +1,186 @@
+import codecs, json, re
+
+try:
+    import orjson
+
+except ImportError:
+    orjson = None
+
+try:
+    import ijson.backends.yajl2_c as ijson
+
+except ImportError:
+    ijson = None
+
+def _default_backend():
+    return orjson.loads if orjson is not None else json.loads
+
+backend = _default_backend()
+
+def set_backend(loads = None):
+    """
+    Choose the function used to decode json.
+    loads: callable taking bytes and returning the decoded json, or None for the default
+           (orjson if it's installed, the json module otherwise)
+    """
+    global backend
+    backend = loads if loads is not None else _default_backend()
+
+def loads(raw):
+    """
+    Decode json straight from bytes, without decoding the body to a str first
+    raw: the body of a response (ie response.content)
+    returns the decoded json
+    """
+    return backend(raw)
+
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+_NUMBER_TAIL = re.compile(r"[0-9.eE+-]*")
+_decoder = json.JSONDecoder()
+
+class _ChunkReader():
+    """
+    File-like wrapper over an iterable of bytes, for parsers that read from a stream
+    """
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._pending = b""
+
+    def read(self, size = -1):
+        while size < 0 or len(self._pending) < size:
+            chunk = next(self._chunks, None)
+
+            if chunk is None:
+                break
+
+            self._pending += chunk
+
+        if size < 0:
+            size = len(self._pending)
+
+        data, self._pending = self._pending[:size], self._pending[size:]
+        return data
+
+class _Scanner():
+    """
+    Reads json values one at a time from an iterable of bytes, keeping only the unread part of the current chunk.
+    Values are decoded by the json module's C scanner, this only steps between them
+    """
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._decode = codecs.getincrementaldecoder("utf-8")()
+        self.buffer = ""
+        self.pos = 0
+        self.exhausted = False
+
+    def fill(self):
+        """
+        Append the next chunk to the unread part of the buffer.
+        returns False if there was nothing left to read
+        """
+        if self.exhausted:
+            return False
+
+        chunk = next(self._chunks, None)
+
+        if chunk is None:
+            self.exhausted = True
+            text = self._decode.decode(b"", final = True)
+
+        else:
+            text = self._decode.decode(chunk)
+
+        self.buffer = self.buffer[self.pos:] + text
+        self.pos = 0
+        return True
+
+    def peek(self):
+        """
+        Skip whitespace.
+        returns the next character, or an empty string at the end of the document
+        """
+        while True:
+            self.pos = _WHITESPACE.match(self.buffer, self.pos).end()
+
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+
+            if not self.fill():
+                return ""
+
+    def take(self, expected):
+        """
+        Consume the next character, which has to be one of expected.
+        returns the character
+        """
+        char = self.peek()
+
+        if not char or char not in expected:
+            raise ValueError(f"expected one of {expected!r}, got {char!r}")
+
+        self.pos += 1
+        return char
+
+    def value(self):
+        """
+        Decode the next value, reading more chunks until it's complete.
+        A value followed by nothing but characters a number can contain is only trusted at the end of the document,
+        since a chunk can end in the middle of a number, ie right after the "." or "e" of 1.5e3
+        """
+        self.peek()
+
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.buffer, self.pos)
+
+                if self.exhausted or not _NUMBER_TAIL.fullmatch(self.buffer, end):
+                    self.pos = end
+                    return value
+
+            except json.JSONDecodeError:
+                if self.exhausted:
+                    raise
+
+            self.fill()
+
+def _scan_items(chunks, key):
+    scanner = _Scanner(chunks)
+    scanner.take("{")
+
+    if scanner.peek() == "}":
+        return
+
+    while True:
+        name = scanner.value()
+        scanner.take(":")
+
+        if name == key and scanner.peek() == "[":
+            scanner.take("[")
+
+            if scanner.peek() == "]":
+                return
+
+            while True:
+                yield scanner.value()
+
+                if scanner.take(",]") == "]":
+                    return
+
+        scanner.value()
+
+        if scanner.take(",}") == "}":
+            return
+
+def iter_items(chunks, key):
+    """
+    Decode the items of a list in a json object as they arrive, rather than parsing the whole document.
+    Only the list under key in the top level object is read, and only one item is held at a time.
+    ijson's C backend is used if it's installed, otherwise each item is decoded by the json module's C scanner
+    chunks: iterable of bytes making up the document, ie response.iter_content(chunk_size)
+    key: name of the list in the top level object, ie "userProfileList"
+    yields each decoded item of the list
+    """
+    if ijson is not None:
+        return ijson.items(_ChunkReader(chunks), f"{key}.item", use_float = True)
+
+    return _scan_items(chunks, key)
@@ -0,0 +1,171 @@
+import threading, requests
+from contextlib import contextmanager
+from itertools import count
+from time import monotonic
+
+INTERACTIVE = 0
+NORMAL = 1
+BACKGROUND = 2
+
+NAMES = {
+    INTERACTIVE: "interactive",
+    NORMAL: "normal",
+    BACKGROUND: "background"
+}
+
+_local = threading.local()
+
+@contextmanager
+def priority(level):
+    """
+    Run every request made by this thread inside the block with a priority, ie to push a bulk job into BACKGROUND.
+    This takes precedence over the priority hinted by the method making the request
+    level: INTERACTIVE, NORMAL or BACKGROUND
+    """
+    previous = getattr(_local, "level", None)
+    _local.level = level
+
+    try:
+        yield
+
+    finally:
+        _local.level = previous
+
+class Scheduler():
+    def __init__(self, limit = 8, caps = None):
+        """
+        Build a scheduler deciding which requests may run, by priority class.
+        Waiting requests are let through highest priority first, then in the order they arrived. A request only
+        waits behind higher priority ones that could actually start, so a class at its cap doesn't hold up the others
+        limit: maximum number of requests running at once
+        caps: dict with the maximum number of running requests for each class. By default background requests
+              are kept off the last half of the slots and normal ones off the last quarter, so interactive
+              requests always have room
+        """
+        self.limit = limit
+        self.caps = caps or {
+            INTERACTIVE: limit,
+            NORMAL: max(1, limit - limit // 4),
+            BACKGROUND: max(1, limit // 2)
+        }
+        self.running = {level: 0 for level in NAMES}
+        self._waiting = []  # (level, sequence) of requests that are waiting, in arrival order
+        self._sequence = count()
+        self._condition = threading.Condition()
+        self._stats = {level: {"requests": 0, "wait": 0.0, "max_wait": 0.0, "recent_wait": 0.0} for level in NAMES}
+
+    def _runnable(self, level):
+        return sum(self.running.values()) < self.limit and self.running[level] < self.caps[level]
+
+    def _turn(self, entry):
+        if not self._runnable(entry[0]):
+            return False
+
+        # let a waiting request of a higher class, or an earlier one of the same class, go first if it can start
+        return not any(other < entry and self._runnable(other[0]) for other in self._waiting)
+
+    def acquire(self, level = NORMAL):
+        """
+        Wait for a slot for a request.
+        returns the seconds spent waiting
+        """
+        entry = (level, next(self._sequence))
+        queued = monotonic()
+
+        with self._condition:
+            self._waiting.append(entry)
+
+            try:
+                self._condition.wait_for(lambda: self._turn(entry))
+
+            finally:
+                self._waiting.remove(entry)
+
+            self.running[level] += 1
+            waited = monotonic() - queued
+
+            stats = self._stats[level]
+            stats["requests"] += 1
+            stats["wait"] += waited
+            stats["max_wait"] = max(stats["max_wait"], waited)
+            stats["recent_wait"] = 0.9 * stats["recent_wait"] + 0.1 * waited
+
+        return waited
+
+    def release(self, level = NORMAL):
+        with self._condition:
+            self.running[level] -= 1
+            self._condition.notify_all()
+
+    @contextmanager
+    def slot(self, level = NORMAL):
+        self.acquire(level)
+
+        try:
+            yield
+
+        finally:
+            self.release(level)
+
+    @property
+    def stats(self):
+        """
+        Queueing numbers for each class
+        returns a dict with name:dict of the requests made, requests running and waiting,
+        and the mean, maximum and recent (exponentially weighted) seconds spent waiting for a slot
+        """
+        with self._condition:
+            return {
+                NAMES[level]: {
+                    "requests": stats["requests"],
+                    "running": self.running[level],
+                    "waiting": sum(1 for entry in self._waiting if entry[0] == level),
+                    "mean_wait": stats["wait"] / stats["requests"] if stats["requests"] else 0.0,
+                    "max_wait": stats["max_wait"],
+                    "recent_wait": stats["recent_wait"]
+                } for level, stats in self._stats.items()
+            }
+
+class ScheduledSession(requests.Session):
+    def __init__(self, scheduler = None):
+        """
+        Build a requests session that runs every request through a Scheduler.
+        Requests take a priority keyword with the class the calling method hints at, NORMAL if it's left out.
+        Streamed requests keep their slot until the response is closed, so they should be used in a with block
+        A priority set with the priority context manager takes precedence over the hint
+        scheduler: Scheduler to use, or None for a default one
+        """
+        requests.Session.__init__(self)
+        self.scheduler = scheduler or Scheduler()
+
+    def request(self, method, url, *args, priority = NORMAL, **kwargs):
+        level = getattr(_local, "level", None)
+        level = priority if level is None else level
+
+        if not kwargs.get("stream"):
+            with self.scheduler.slot(level):
+                return requests.Session.request(self, method, url, *args, **kwargs)
+
+        # a streamed body is downloaded after this returns, so the slot is held until the response is closed
+        self.scheduler.acquire(level)
+
+        try:
+            response = requests.Session.request(self, method, url, *args, **kwargs)
+
+        except BaseException:
+            self.scheduler.release(level)
+            raise
+
+        close = response.close
+        released = threading.Lock()
+
+        def close_and_release():
+            try:
+                close()
+
+            finally:
+                if released.acquire(blocking = False):
+                    self.scheduler.release(level)
+
+        response.close = close_and_release
+        return response
@@ -1,5 +1,4 @@
-import requests
-from amino.lib.util import exceptions
+from amino.lib.util import exceptions, scheduler
 
 class NewBlog():
     def __init__(self, title, body, client):
@@ -44,7 +43,7 @@ class MediaItem():
             return self._uploaded
 
         if self._source_url:
-            response = requests.get(self._source_url)
+            response = self.client.session.get(self._source_url, priority = scheduler.BACKGROUND)
 
             if response.status_code != 200:
                 raise exceptions.CannotFetchImage
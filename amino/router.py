@@ -0,0 +1,265 @@
+import re, threading
+
+_GLOBAL_FLAGS = re.compile(r"\(\?[aiLmsux]+\)")
+_BACKREFERENCE = re.compile(r"\\[1-9]|\(\?P=\d")
+_SCOPED_FLAGS = ((re.IGNORECASE, "i"), (re.MULTILINE, "m"), (re.DOTALL, "s"), (re.VERBOSE, "x"), (re.ASCII, "a"))
+
+class Route():
+    def __init__(self, handler, prefix = None, pattern = None, communities = None, threads = None):
+        """
+        Build a route from a text message to a handler.
+        handler: called with (data, args) for prefix routes, where args is the rest of the message,
+                 or with (data, match) for pattern routes
+        prefix: command the message has to start with, followed by whitespace or the end of the message
+        pattern: regular expression that is searched for in the message
+        communities: ndcIds the route is limited to, or None
+        threads: thread ids the route is limited to, or None
+        """
+        self.handler = handler
+        self.prefix = prefix
+        self.pattern = re.compile(pattern) if pattern is not None else None
+        self.communities = communities
+        self.threads = threads
+
+    def scopes(self):
+        """
+        returns the scopes this route is registered under. None is the unscoped scope
+        """
+        if not self.communities and not self.threads:
+            return [None]
+
+        return [("community", id) for id in self.communities or ()] + [("thread", id) for id in self.threads or ()]
+
+    def __repr__(self):
+        return f"Route({self.prefix or self.pattern.pattern} -> {getattr(self.handler, '__name__', self.handler)})"
+
+class _Table():
+    """
+    The routes registered under a single scope.
+    Prefixes are kept in a character trie and patterns in as few combined regular expressions as possible,
+    so matching a message costs the same however many routes there are.
+    """
+    def __init__(self):
+        self.trie = {}
+        self.patterns = []
+        self._compiled = None
+
+    def add(self, route):
+        if route.prefix is not None:
+            node = self.trie
+
+            for char in route.prefix:
+                node = node.setdefault(char, {})
+
+            node[None] = route
+
+        else:
+            # checked here so a pattern that can't be combined fails at registration, not on the socket thread
+            source = self._portable(route.pattern)
+
+            try:
+                re.compile(f"(?P<_route0>{source})")
+
+            except re.error:
+                source = None
+
+            # numbered backreferences would point at the wrong group once wrapped
+            if source is not None and _BACKREFERENCE.search(source):
+                source = None
+
+            self.patterns.append((route, source))
+            self._compiled = None
+
+    @staticmethod
+    def _portable(pattern):
+        """
+        Rewrite a compiled pattern so it keeps its flags inside an alternation.
+        Leading global flags like (?i) and flags passed to re.compile become a scoped (?i:...) group
+        returns the rewritten source
+        """
+        source = pattern.pattern
+
+        while _GLOBAL_FLAGS.match(source):
+            source = source[_GLOBAL_FLAGS.match(source).end():]
+
+        flags = "".join(letter for flag, letter in _SCOPED_FLAGS if pattern.flags & flag)
+
+        if not flags:
+            return source
+
+        # a verbose pattern can end in a comment, which would swallow the closing parenthesis
+        return f"(?{flags}:{source}\n)" if pattern.flags & re.VERBOSE else f"(?{flags}:{source})"
+
+    def _compile(self):
+        """
+        Join the patterns into alternations of named groups, one group per route.
+        Patterns whose own named groups clash are put into a separate alternation, and patterns that
+        can't be part of one at all are searched on their own
+        """
+        compiled = []
+        chunk = []
+
+        for route, source in self.patterns:
+            if source is None:
+                if chunk:
+                    compiled.append((re.compile(self._join(chunk)), [route for route, _ in chunk]))
+                    chunk = []
+
+                compiled.append((route.pattern, route))
+                continue
+
+            try:
+                re.compile(self._join(chunk + [(route, source)]))
+
+            except re.error:
+                if chunk:
+                    compiled.append((re.compile(self._join(chunk)), [route for route, _ in chunk]))
+
+                chunk = [(route, source)]
+
+            else:
+                chunk.append((route, source))
+
+        if chunk:
+            compiled.append((re.compile(self._join(chunk)), [route for route, _ in chunk]))
+
+        self._compiled = compiled
+
+    @staticmethod
+    def _join(chunk):
+        return "|".join(f"(?P<_route{index}>{source})" for index, (_, source) in enumerate(chunk))
+
+    def match_prefix(self, content):
+        node = self.trie
+        found = None
+
+        for index, char in enumerate(content):
+            node = node.get(char)
+
+            if node is None:
+                break
+
+            if None in node and (index + 1 == len(content) or content[index + 1].isspace()):
+                found = (node[None], content[index + 1:].strip())
+
+        return found
+
+    def match_pattern(self, content):
+        if self._compiled is None:
+            self._compile()
+
+        for combined, routes in self._compiled:
+            match = combined.search(content)
+
+            if match and isinstance(routes, Route):
+                # a pattern searched on its own
+                return routes, match
+
+            if match:
+                route = routes[int(match.lastgroup[len("_route"):])]
+                # re-run the winning route alone so the handler sees its own groups
+                return route, route.pattern.search(content, match.start())
+
+        return None
+
+class Router():
+    def __init__(self):
+        """
+        Build a command router for text messages.
+        Routes are looked up by thread, then by community, then unscoped. Within a scope, prefix routes
+        are tried before pattern routes, and when several patterns match the leftmost match wins
+        """
+        self._tables = {}
+        self._lock = threading.Lock()
+
+    def add(self, route):
+        with self._lock:
+            for scope in route.scopes():
+                self._tables.setdefault(scope, _Table()).add(route)
+
+        return route
+
+    def command(self, prefix, communities = None, threads = None):
+        """
+        Decorator registering a handler for messages starting with a command.
+        prefix: the command, ie "!help"
+        communities: ndcIds the command is limited to, or None
+        threads: thread ids the command is limited to, or None
+        """
+        def decorator(handler):
+            self.add(Route(handler, prefix = prefix, communities = communities, threads = threads))
+            return handler
+
+        return decorator
+
+    def pattern(self, pattern, communities = None, threads = None):
+        """
+        Decorator registering a handler for messages matching a regular expression.
+        Patterns are combined into as few searches as possible. Ones that can't be, like patterns with numbered
+        backreferences, are searched on their own
+        pattern: the regular expression, searched for anywhere in the message
+        communities: ndcIds the pattern is limited to, or None
+        threads: thread ids the pattern is limited to, or None
+        """
+        def decorator(handler):
+            self.add(Route(handler, pattern = pattern, communities = communities, threads = threads))
+            return handler
+
+        return decorator
+
+    def match(self, content, community_id = None, thread_id = None):
+        """
+        Find the route for a message.
+        content: text of the message
+        community_id: ndcId the message was sent in
+        thread_id: thread id the message was sent in
+        returns a (Route, args or match) tuple, or None if no route matches
+        """
+        for scope in (("thread", thread_id), ("community", community_id), None):
+            table = self._tables.get(scope)
+
+            if table is None:
+                continue
+
+            found = table.match_prefix(content) or table.match_pattern(content)
+
+            if found:
+                return found
+
+        return None
+
+    def dispatch(self, data):
+        """
+        Route a decoded text message frame to its handler.
+        returns a (True, handler return value) tuple if a route matched, or (False, None)
+        """
+        message = data["o"]["chatMessage"]
+        found = self.match(message.get("content") or "", data["o"].get("ndcId"), message.get("threadId"))
+
+        if not found:
+            return False, None
+
+        route, argument = found
+        return True, route.handler(data, argument)
+
+def command(prefix, communities = None, threads = None):
+    """
+    Decorator marking a Callbacks method as a command handler, see Router.command.
+    Marked methods are registered on the instance's router when the Callbacks is built
+    """
+    def decorator(method):
+        method.__dict__.setdefault("_routes", []).append({"prefix": prefix, "communities": communities, "threads": threads})
+        return method
+
+    return decorator
+
+def pattern(pattern, communities = None, threads = None):
+    """
+    Decorator marking a Callbacks method as a pattern handler, see Router.pattern.
+    Marked methods are registered on the instance's router when the Callbacks is built
+    """
+    def decorator(method):
+        method.__dict__.setdefault("_routes", []).append({"pattern": pattern, "communities": communities, "threads": threads})
+        return method
+
+    return decorator
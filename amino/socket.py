@@ -1,23 +1,137 @@
-import websocket, time, json, threading
+import websocket, time, threading
+from amino import router
+from amino.lib.util import parsing
+
+class KeepAlive():
+    def __init__(self, min_interval = 10, max_interval = 60, stall_timeout = 180, max_missed = 2):
+        """
+        Build the liveness state for one websocket connection.
+        Pings are only sent once the connection has been quiet for the current interval. The interval halves
+        every time a pong is missed and grows back towards max_interval while pongs come back in time
+        min_interval: shortest number of seconds between pings
+        max_interval: longest number of seconds between pings
+        stall_timeout: seconds without any frame after which the connection is considered stalled
+        max_missed: number of pongs in a row that can be missed before the connection is considered stalled
+        """
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.stall_timeout = stall_timeout
+        self.max_missed = max_missed
+        self.reset()
+
+    def reset(self):
+        """
+        Reset the state for a new connection
+        """
+        now = time.monotonic()
+        self.interval = self.max_interval
+        self.last_frame = now
+        self.ping_sent = None
+        self.rtt = None
+        self.srtt = None
+        self.missed = 0
+
+    @property
+    def pong_timeout(self):
+        """
+        Seconds to wait for a pong, several times the smoothed round trip time but at least 5
+        """
+        return max(5, 4 * self.srtt) if self.srtt is not None else 10
+
+    def frame(self):
+        """
+        Record that a frame arrived
+        """
+        self.last_frame = time.monotonic()
+
+    def ping(self):
+        self.ping_sent = time.monotonic()
+
+    def pong(self):
+        """
+        Record a pong, updating the round trip times and relaxing the interval
+        """
+        now = time.monotonic()
+        self.last_frame = now
+
+        if self.ping_sent is None:
+            return
+
+        self.rtt = now - self.ping_sent
+        self.srtt = self.rtt if self.srtt is None else 0.875 * self.srtt + 0.125 * self.rtt
+        self.ping_sent = None
+        self.missed = 0
+        self.interval = min(self.max_interval, self.interval * 1.5)
+
+    def check(self):
+        """
+        Decide what the connection needs right now.
+        returns "recycle" if it's stalled, "ping" if a ping should be sent, or None
+        """
+        now = time.monotonic()
+
+        if now - self.last_frame > self.stall_timeout:
+            return "recycle"
+
+        if self.ping_sent is not None:
+            if now - self.ping_sent < self.pong_timeout:
+                return None
+
+            self.ping_sent = None
+            self.missed += 1
+            self.interval = max(self.min_interval, self.interval / 2)
+
+            if self.missed >= self.max_missed:
+                return "recycle"
+
+        if now - self.last_frame >= self.interval:
+            return "ping"
+
+        return None
 
 class SocketHandler():
-    def __init__(self, client, socket_trace = False):
+    def __init__(self, client, socket_trace = False, keepalive = None):
         """
         Build the websocket connection.
         client: client that owns the websocket connection.
+        keepalive: KeepAlive used to watch the connection, or None for the defaults
         """
         websocket.enableTrace(True)
         self.socket_url = "wss://ws1.narvii.com"
         self.client = client
         self.active = False
+        self.reconnect = True
         self.headers = None
         self.socket = None
         self.socket_thread = None
+        self.keepalive = keepalive or KeepAlive()
+        self.pings = 0
+        self.missed_pongs = 0
+        self.recycles = 0
+        self._monitor_thread = None
+        self._monitor_stop = threading.Event()
 
         websocket.enableTrace(socket_trace)
 
+    @property
+    def metrics(self):
+        """
+        Liveness numbers for the current connection
+        returns a dict with the last and smoothed ping round trip times, the current keepalive interval,
+        the seconds since the last frame, and counters for pings, missed pongs and recycled connections
+        """
+        return {
+            "rtt": self.keepalive.rtt,
+            "srtt": self.keepalive.srtt,
+            "ping_interval": self.keepalive.interval,
+            "since_last_frame": time.monotonic() - self.keepalive.last_frame,
+            "pings": self.pings,
+            "missed_pongs": self.missed_pongs,
+            "recycles": self.recycles
+        }
+
     def on_open(self):
-        pass
+        self.keepalive.reset()
 
     def on_close(self):
         self.active = False
@@ -29,12 +143,45 @@ class SocketHandler():
         print("closed")
 
     def on_ping(self, data):
+        self.keepalive.frame()
         self.socket.sock.pong(data)
 
+    def on_pong(self, data):
+        self.keepalive.pong()
+
     def handle_message(self, data):
+        self.keepalive.frame()
         self.client.handle_socket_message(data)
         return
 
+    def recycle(self):
+        """
+        Drop the current connection. on_close opens a new one unless close was called
+        """
+        self.recycles += 1
+        self.socket.close()
+
+    def _monitor(self, tick = 1):
+        while not self._monitor_stop.wait(tick):
+            if not self.active or not self.socket or not self.socket.sock:
+                continue
+
+            missed = self.keepalive.missed
+            action = self.keepalive.check()
+            self.missed_pongs += self.keepalive.missed > missed
+
+            try:
+                if action == "ping":
+                    self.keepalive.ping()
+                    self.socket.sock.ping()
+                    self.pings += 1
+
+                elif action == "recycle":
+                    self.recycle()
+
+            except websocket.WebSocketException:
+                self.recycle()
+
     def send(self, data):
         self.socket.send(data)
 
@@ -50,16 +197,25 @@ class SocketHandler():
             on_open = self.on_open,
             on_close = self.on_close,
             on_ping = self.on_ping,
+            on_pong = self.on_pong,
             header = self.headers
         )
 
-        self.socket_thread = threading.Thread(target = self.socket.run_forever, kwargs = {"ping_interval" : 60})
+        # pings are sent by the monitor thread, which adjusts how often they're needed
+        self.keepalive.reset()
+        self.socket_thread = threading.Thread(target = self.socket.run_forever)
         self.socket_thread.start()
         self.active = True
 
+        if not self._monitor_thread or not self._monitor_thread.is_alive():
+            self._monitor_stop.clear()
+            self._monitor_thread = threading.Thread(target = self._monitor, daemon = True)
+            self._monitor_thread.start()
+
     def close(self):
         self.reconnect = False
         self.active = False
+        self._monitor_stop.set()
         self.socket.close()
 
 class Callbacks:
@@ -70,6 +226,11 @@ class Callbacks:
         client: Client to be used
         """
         self.client = client
+        self.router = router.Router()
+
+        for name in dir(type(self)):
+            for options in getattr(getattr(type(self), name), "_routes", ()):
+                self.router.add(router.Route(getattr(self, name), **options))
 
         self.methods = {
             1000: self._resolve_chat_message
@@ -93,18 +254,29 @@ class Callbacks:
         """
         Resolves to a chat method based on the data's `chatMessage > type`  and `chatMessage > mediaType` parameter.
         if there is no `mediaType`, then the default fallback value `0` will be used
+        Text messages are offered to the router first, and only reach on_text_message if no route matches
         returns the return value of the appropriate method
         """
 
         key = f"{data['o']['chatMessage']['type']}:{data['o']['chatMessage'].get('mediaType', 0)}"
+
+        if key == "0:0":
+            routed, value = self.router.dispatch(data)
+
+            if routed:
+                return value
+
         return self.chat_methods.get(key, self.default)(data)
 
     def resolve(self, data):
         """
         Resolves to a method based on the data's `t` parameter.
+        data: the socket frame, either raw or already decoded
         returns the return value of the appropriate method
         """
-        data = json.loads(data)
+        if isinstance(data, (str, bytes)):
+            data = parsing.loads(data)
+
         return self.methods.get(data["t"], self.default)(data)
 
     def on_text_message(self, data):
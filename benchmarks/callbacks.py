@@ -0,0 +1,220 @@
+"""
+Load test for the socket dispatch path, SocketHandler.handle_message -> Client.handle_socket_message
+-> Callbacks.resolve -> Callbacks.chat_methods, without touching the network.
+Run from the repository root with `python -m benchmarks.callbacks --help` for the options.
+The process exits with 1 if a --min-eps or --max-p99 threshold isn't met, so it can gate CI
+"""
+import argparse, json, os, sys, tempfile, tracemalloc
+from itertools import cycle
+from time import perf_counter, perf_counter_ns, sleep
+from amino import client, community, directory, socket
+
+COMMUNITY_ID = 1
+
+class OfflineClient(client.Client):
+    """
+    A Client that skips the device configuration request, so it can be built without a network
+    """
+    def client_config(self):
+        pass
+
+def build_client(home_path, callback = socket.Callbacks, routes = 0, with_directory = True):
+    """
+    Build an offline client for the benchmark.
+    home_path: directory the client's device.json is written to
+    """
+    bench = OfflineClient(path = os.path.join(home_path, "device.json"), callback = callback)
+    bench.uid = "bench-self"
+
+    for index in range(routes):
+        bench.callbacks.router.command(f"!command{index}")(lambda data, args: None)
+
+    if with_directory:
+        home = community.Community({"name": "bench", "endpoint": "bench", "link": "http://aminoapps.com/c/bench", "ndcId": COMMUNITY_ID})
+        bench.directories[COMMUNITY_ID] = directory.PeerDirectory(bench, home)
+
+    return bench
+
+def author(index):
+    return {
+        "uid": f"{index:08x}-0000-4000-8000-{index:012x}",
+        "nickname": f"member {index}",
+        "status": 0,
+        "icon": f"http://pm1.narvii.com/{index}/icon.jpg",
+        "reputation": index % 5000,
+        "role": 0,
+        "ndcId": COMMUNITY_ID,
+        "level": index % 20,
+        "membershipStatus": 0,
+        "accountMembershipStatus": 0,
+        "isNicknameVerified": False
+    }
+
+def media(key, index):
+    """
+    returns the mediaValue and extensions for a chat message key, shaped like the ones the socket sends
+    """
+    if key == "0:100":
+        return f"http://pm1.narvii.com/{index}/image.jpg", {}
+
+    if key == "0:103":
+        return f"ytv://{index:011d}", {"mediaTitle": f"video {index}"}
+
+    if key == "2:110":
+        return f"http://cv1.narvii.com/{index}/voice.aac", {"duration": 3.2}
+
+    if key == "3:113":
+        return f"ndcsticker://{index}", {"sticker": {"stickerId": f"sticker-{index}", "name": "wave"}}
+
+    return None, {}
+
+def frame(key, index, routes = 0):
+    """
+    Build a raw t:1000 frame for a chat_methods key.
+    routes: number of router commands registered, every other text message then starts with one of them
+    """
+    type, media_type = (int(part) for part in key.split(":"))
+    value, extensions = media(key, index)
+    content = f"message number {index} with some ordinary text in it" if key == "0:0" else None
+
+    if key == "0:0" and routes and index % 2:
+        content = f"!command{index % routes} argument"
+
+    return json.dumps({
+        "t": 1000,
+        "o": {
+            "ndcId": COMMUNITY_ID,
+            "alertOption": 1,
+            "membershipStatus": 1,
+            "chatMessage": {
+                "threadId": f"thread-{index % 50}",
+                "mediaType": media_type,
+                "content": content,
+                "clientRefId": index,
+                "messageId": f"message-{index}",
+                "uid": author(index % 2000)["uid"],
+                "createdTime": "2019-06-01T00:00:00Z",
+                "type": type,
+                "isHidden": False,
+                "includedInSummary": True,
+                "mediaValue": value,
+                "extensions": extensions,
+                "author": author(index % 2000)
+            }
+        }
+    })
+
+def frames(keys, count, routes = 0):
+    """
+    Build count frames cycling through every chat_methods key, with unique messageIds so none are deduplicated
+    """
+    return [frame(key, index, routes) for index, key in zip(range(count), cycle(keys))]
+
+def percentile(ordered, fraction):
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+def measure_latency(handler, batch, rate = 0):
+    """
+    Push frames through handler, optionally at a fixed rate.
+    rate: events per second to offer, or 0 to go as fast as possible
+    returns (events per second, sorted list of per-event latencies in seconds)
+    """
+    latencies = []
+    interval = 1 / rate if rate else 0
+    start = perf_counter()
+
+    for index, data in enumerate(batch):
+        if interval:
+            delay = start + index * interval - perf_counter()
+
+            if delay > 0:
+                sleep(delay)
+
+        began = perf_counter_ns()
+        handler(data)
+        latencies.append((perf_counter_ns() - began) / 1e9)
+
+    elapsed = perf_counter() - start
+    latencies.sort()
+    return len(batch) / elapsed, latencies
+
+def measure_memory(handler, batch):
+    """
+    Push frames through handler with tracemalloc running.
+    returns (bytes still allocated per event once it's handled, mean bytes allocated at the peak of handling an event)
+    """
+    tracemalloc.start()
+    start, _ = tracemalloc.get_traced_memory()
+    transient = 0
+
+    for data in batch:
+        before, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        handler(data)
+        _, peak = tracemalloc.get_traced_memory()
+        transient += peak - before
+
+    after, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return (after - start) / len(batch), transient / len(batch)
+
+def run(events = 50000, rate = 0, warmup = 2000, routes = 0, with_directory = True):
+    """
+    Run the load test.
+    returns a dict with the results
+    """
+    with tempfile.TemporaryDirectory() as home_path:
+        bench = build_client(home_path, routes = routes, with_directory = with_directory)
+
+    handler = bench.socket.handle_message
+    keys = list(bench.callbacks.chat_methods)
+    batch = frames(keys, warmup + 2 * events, routes)
+
+    measure_latency(handler, batch[:warmup])
+    eps, latencies = measure_latency(handler, batch[warmup:warmup + events], rate)
+    retained, peak = measure_memory(handler, batch[warmup + events:])
+
+    return {
+        "events": events,
+        "keys": keys,
+        "rate": rate,
+        "events_per_second": eps,
+        "p50_us": percentile(latencies, 0.5) * 1e6,
+        "p90_us": percentile(latencies, 0.9) * 1e6,
+        "p99_us": percentile(latencies, 0.99) * 1e6,
+        "max_us": latencies[-1] * 1e6,
+        "retained_bytes_per_event": retained,
+        "peak_bytes_per_event": peak,
+        "suppressed_duplicates": bench.deduplicator.suppressed
+    }
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = "Load test the Callbacks dispatch path")
+    parser.add_argument("--events", type = int, default = 50000, help = "number of frames to measure")
+    parser.add_argument("--rate", type = float, default = 0, help = "frames offered per second, 0 for as fast as possible")
+    parser.add_argument("--warmup", type = int, default = 2000, help = "frames dispatched before measuring")
+    parser.add_argument("--routes", type = int, default = 0, help = "router commands to register, half of the text messages hit one")
+    parser.add_argument("--no-directory", action = "store_true", help = "don't feed frames to a PeerDirectory")
+    parser.add_argument("--json", action = "store_true", help = "print the results as json")
+    parser.add_argument("--min-eps", type = float, help = "fail if fewer events per second are handled")
+    parser.add_argument("--max-p99", type = float, help = "fail if the 99th percentile latency is above this, in microseconds")
+    args = parser.parse_args(argv)
+
+    results = run(args.events, args.rate, args.warmup, args.routes, not args.no_directory)
+
+    if args.json:
+        print(json.dumps(results, indent = 4))
+
+    else:
+        print(f"{results['events']} events over {', '.join(results['keys'])}")
+        print(f"throughput   {results['events_per_second']:,.0f} events/s")
+        print(f"latency      p50 {results['p50_us']:.1f}us  p90 {results['p90_us']:.1f}us  p99 {results['p99_us']:.1f}us  max {results['max_us']:.1f}us")
+        print(f"memory       {results['retained_bytes_per_event']:.0f} B/event retained, {results['peak_bytes_per_event']:.0f} B/event at peak")
+
+    failed = (args.min_eps is not None and results["events_per_second"] < args.min_eps) or \
+             (args.max_p99 is not None and results["p99_us"] > args.max_p99)
+
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
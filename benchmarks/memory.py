@@ -0,0 +1,118 @@
+"""
+Compare the memory used by the slotted models in amino.community with the dict-backed layout they replaced.
+Run from the repository root with `python -m benchmarks.memory [count]`
+"""
+import sys, tracemalloc
+from amino import community
+
+def user_payload(index):
+    """
+    returns a userProfile payload shaped like the ones in userProfileList, membersSummary and message authors
+    """
+    return {
+        "uid": f"{index:08x}-0000-4000-8000-{index:012x}",
+        "nickname": f"member {index}",
+        "status": 0,
+        "icon": f"http://pm1.narvii.com/{index}/icon.jpg",
+        "reputation": index % 5000,
+        "role": 0,
+        "ndcId": 1,
+        "level": index % 20,
+        "membershipStatus": 0,
+        "accountMembershipStatus": 0,
+        "isGlobal": False,
+        "onlineStatus": 1,
+        "isNicknameVerified": False,
+        "createdTime": "2019-06-01T00:00:00Z",
+        "modifiedTime": "2019-06-01T00:00:00Z",
+        "mediaList": [[100, f"http://pm1.narvii.com/{index}/media.jpg", None]],
+        "extensions": {"style": {"backgroundColor": "#ffffff"}, "defaultBubbleId": None},
+        "content": "a short bio " * 4
+    }
+
+def thread_payload(index):
+    return {
+        "threadId": f"thread-{index}",
+        "ndcId": 1,
+        "type": 0,
+        "membersSummary": [user_payload(index), user_payload(index + 1)]
+    }
+
+def message_payload(index):
+    return {
+        "messageId": f"message-{index}",
+        "createdTime": "2019-06-01T00:00:00Z",
+        "content": f"message number {index}",
+        "threadId": f"thread-{index % 100}",
+        "author": user_payload(index % 1000 + index)
+    }
+
+class LegacyPeer():
+    def __init__(self, user_data, client, community_obj):
+        self.api = community.Peer.api
+        self.community = community_obj
+        self.client = client
+        self.uid = user_data["uid"]
+        self.nick = user_data["nickname"]
+        self._data = user_data
+
+class LegacyChatThread():
+    def __init__(self, data, client):
+        self.api = community.ChatThread.api
+        self.client = client
+        self.uid = data["threadId"]
+        self._community_id = data["ndcId"]
+        self.type = data.get("type")
+        self._members_data = data["membersSummary"]
+        self.member_count = len(self._members_data)
+
+class LegacyMessage():
+    def __init__(self, data, client):
+        self.client = client
+        self.uid = data["messageId"]
+        self.created = data["createdTime"]
+        self.content = data["content"]
+        self._community_id = data["author"]["ndcId"]
+        self._author = data["author"]
+        self._thread_id = data["threadId"]
+
+def measure(build, count):
+    """
+    Build count objects, with the payloads decoded inside the measurement the way responses are.
+    returns the number of bytes still allocated once the objects are built
+    """
+    tracemalloc.start()
+    objects = [build(index) for index in range(count)]
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del objects
+    return size
+
+def run(count = 20000):
+    home = community.Community({"name": "bench", "endpoint": "bench", "link": "http://aminoapps.com/c/bench", "ndcId": 1})
+    cases = [
+        ("Peer", lambda index: LegacyPeer(user_payload(index), None, home), lambda index: community.Peer(user_payload(index), None, home)),
+        ("ChatThread", lambda index: LegacyChatThread(thread_payload(index), None), lambda index: community.ChatThread(thread_payload(index), None)),
+        ("Message", lambda index: LegacyMessage(message_payload(index), None), lambda index: community.Message(message_payload(index), None))
+    ]
+
+    print(f"{'model':<12}{'legacy':>14}{'slotted':>14}{'dropped':>14}   ({count} objects)")
+
+    for name, legacy, slotted in cases:
+        legacy_size = measure(legacy, count)
+        slotted_size = measure(slotted, count)
+        model = getattr(community, name)
+
+        if hasattr(model, "keep_payload"):
+            model.keep_payload = False
+            dropped_size = measure(slotted, count)
+            model.keep_payload = True
+            dropped = f"{dropped_size / count:>10.0f} B/o"
+
+        else:
+            dropped = f"{'-':>14}"
+
+        print(f"{name:<12}{legacy_size / count:>10.0f} B/o{slotted_size / count:>10.0f} B/o{dropped}")
+
+if __name__ == "__main__":
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 20000)
@@ -0,0 +1,34 @@
+import json, unittest
+from amino.lib.util import parsing
+
+DOCUMENTS = [
+    {"a": 1.5e3, "list": [{"uid": "a", "nickname": "A"}, {"uid": "b", "nickname": "B"}]},
+    {"list": [1.5e3, 2.25, 10, -3, -0.5e-2, 7E+2]},
+    {"before": [1, {"nested": [2.5]}], "list": [{"nickname": "žluťoučký kůň", "icon": "🐴"}, "ünïcödé", 12.75], "after": -1e-3},
+    {"list": []},
+    {}
+]
+
+def split(raw, size):
+    return [raw[index:index + size] for index in range(0, len(raw), size)]
+
+class ScanItemsTest(unittest.TestCase):
+    def test_every_chunk_size(self):
+        for document in DOCUMENTS:
+            raw = json.dumps(document, ensure_ascii = False).encode("utf-8")
+            expected = document.get("list", [])
+
+            for size in range(1, len(raw) + 1):
+                with self.subTest(document = document, size = size):
+                    self.assertEqual(list(parsing._scan_items(split(raw, size), "list")), expected)
+
+    def test_iter_items(self):
+        raw = json.dumps(DOCUMENTS[2], ensure_ascii = False).encode("utf-8")
+        self.assertEqual(list(parsing.iter_items(split(raw, 7), "list")), DOCUMENTS[2]["list"])
+
+    def test_truncated_document(self):
+        with self.assertRaises(ValueError):
+            list(parsing._scan_items(split(b'{"list": [1.5, 2.', 3), "list"))
+
+if __name__ == "__main__":
+    unittest.main()